@@ -8,6 +8,7 @@ from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
 from homeassistant.exceptions import ConfigEntryNotReady
 
+from .bus import Rs485Module, async_get_shared_bus, async_release_shared_bus
 from .const import DOMAIN, CONF_PORT, CONF_BAUDRATE
 
 _LOGGER = logging.getLogger("custom_components.ha_udk_0410_dimmer")
@@ -19,6 +20,7 @@ PLATFORMS: list[str] = ["light"]
 class Rs485Runtime:
     port: str
     baudrate: int
+    bus: Rs485Module
 
 
 async def async_setup(hass: HomeAssistant, config: dict[str, Any]) -> bool:
@@ -38,7 +40,14 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         _LOGGER.error("Missing port/baudrate in config entry")
         return False
 
-    hass.data[DOMAIN][entry.entry_id] = Rs485Runtime(port=port, baudrate=int(baudrate))
+    # Open the shared bus once here, so platform setup only has to look it up
+    try:
+        bus = await async_get_shared_bus(hass, port, int(baudrate))
+    except Exception as err:
+        _LOGGER.warning("HA UDK-0410 Dimmer: Verbindung zu %s fehlgeschlagen: %s", port, err)
+        raise ConfigEntryNotReady from err
+
+    hass.data[DOMAIN][entry.entry_id] = Rs485Runtime(port=port, baudrate=int(baudrate), bus=bus)
 
     entry.async_on_unload(entry.add_update_listener(_async_update_listener))
 
@@ -46,6 +55,8 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
     except Exception as err:
         _LOGGER.exception("Failed to forward setup: %s", err)
+        hass.data[DOMAIN].pop(entry.entry_id, None)
+        await async_release_shared_bus(hass, bus)
         raise ConfigEntryNotReady from err
 
     return True
@@ -60,5 +71,7 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
     if unload_ok:
-        hass.data[DOMAIN].pop(entry.entry_id, None)
+        runtime = hass.data[DOMAIN].pop(entry.entry_id, None)
+        if runtime is not None:
+            await async_release_shared_bus(hass, runtime.bus)
     return unload_ok
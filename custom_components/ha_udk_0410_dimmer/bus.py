@@ -0,0 +1,447 @@
+"""Shared RS485 bus for the UDK-0410 modules.
+
+One Rs485Module per serial port, shared by all config entries using it:
+- flushes stale bytes before sending (best-effort)
+- reads in small chunks until a response pattern is found or a deadline is hit
+- reconnects after a lost link and resends the frame once
+- SET requests for channels of the same module arriving within a short window
+  are merged into one frame (one round-trip instead of one per channel)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import re
+import time
+from typing import Awaitable, Callable, Optional, Tuple
+
+import serial_asyncio
+from homeassistant.core import HomeAssistant
+
+from .protocol import ModuleFrame, merge_set_frames
+
+_LOGGER = logging.getLogger("custom_components.ha_udk_0410_dimmer")
+
+# hass.data key of the process-wide bus map: (resolved port, baudrate) -> Rs485Module
+SHARED_BUSES = "rs485_shared_buses"
+
+# Upper bound for the length of a response frame matched by a pattern; the
+# incremental search re-checks this many trailing bytes when a chunk arrives.
+_MAX_PATTERN_LEN = 16
+
+
+class Hex:
+    """Lazy hex formatter for log arguments (only converted if the record is emitted)."""
+
+    __slots__ = ("_data",)
+
+    def __init__(self, data: bytes | bytearray) -> None:
+        self._data = data
+
+    def __str__(self) -> str:
+        return self._data.hex()
+
+
+class _ConnectionLost(Exception):
+    """The serial link of an Rs485Module is gone and has to be reopened."""
+
+
+class _PendingSet:
+    """SET requests for one module address waiting for the batch window to close."""
+
+    __slots__ = ("send", "frames", "waiters")
+
+    def __init__(self, send: Callable[[bytes], Awaitable[bool]]) -> None:
+        self.send = send
+        self.frames: dict[int, bytes] = {}
+        self.waiters: list[asyncio.Future[bool]] = []
+
+
+class Rs485Module:
+    """Shared RS485 connection per serial port (with a lock)."""
+
+    BATCH_WINDOW_S = 0.01
+    MERGED_CACHE_SIZE = 32
+    DRAIN_TIMEOUT_S = 0.25
+    SILENT_GAP_S = 0.004  # ~3.5 character times at 38400 baud
+
+    def __init__(
+        self,
+        port: str = "/dev/serial/by-id/usb-FTDI_FT232R_USB_UART_BG00Y9JZ-if00-port0",
+        baudrate: int = 38400,
+    ):
+        self.port = port
+        self.baudrate = baudrate
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._serial = None  # underlying pyserial object (if the transport exposes it)
+        self._lock = asyncio.Lock()
+        self._connect_task: Optional[asyncio.Task] = None
+        self._closed = False
+        self._next_tx = 0.0  # loop time before which no new frame may be sent
+        self.users = 0  # config entries holding this bus (see async_get_shared_bus)
+        self._pending: dict[int, _PendingSet] = {}
+        self._flush_tasks: set[asyncio.Task] = set()
+        # merged frames of repeating multi-channel sets (scenes), keyed by address + slot frames
+        self._merged_cache: dict[tuple, bytes] = {}
+        # SET frame builders per module address, shared by the channels of a module
+        self._module_frames: dict[int, ModuleFrame] = {}
+
+    def module_frame(self, address: int) -> ModuleFrame:
+        """Return the SET frame builder for a module address on this bus."""
+        frame = self._module_frames.get(address)
+        if frame is None:
+            frame = self._module_frames[address] = ModuleFrame(address)
+        return frame
+
+    async def connect(self) -> None:
+        async with self._lock:
+            self._closed = False
+            if self._writer is not None and self._reader is not None:
+                return
+            await self._open()
+
+    async def _open(self) -> None:
+        _LOGGER.debug("RS485: Öffne serielle Verbindung %s @ %d", self.port, self.baudrate)
+        reader, writer = await serial_asyncio.open_serial_connection(
+            url=self.port, baudrate=self.baudrate, bytesize=8, parity="N", stopbits=1
+        )
+        if self._closed:
+            # close() ran while the port was opening; do not leave a handle on a released bus
+            writer.close()
+            raise _ConnectionLost("Bus wurde während des Öffnens geschlossen")
+        self._reader, self._writer = reader, writer
+        self._serial = writer.transport.get_extra_info("serial")
+        _LOGGER.debug("RS485: Serielle Verbindung zu %s aufgebaut", self.port)
+        _LOGGER.info("HA UDK-0410 Dimmer: Verbunden mit %s @ %d baud", self.port, self.baudrate)
+
+    async def _reconnect(self) -> bool:
+        """Reopen the port after a connection loss.
+
+        Concurrent callers share one attempt; the attempt runs as its own task
+        so a cancelled caller does not abort it halfway.
+        """
+        if self._closed:
+            return False
+        if self._connect_task is None or self._connect_task.done():
+            _LOGGER.info("HA UDK-0410 Dimmer: Verbinde %s neu", self.port)
+            self._connect_task = asyncio.get_running_loop().create_task(self._open())
+        try:
+            await asyncio.shield(self._connect_task)
+        except Exception as err:
+            _LOGGER.warning("RS485: Neuverbindung zu %s fehlgeschlagen: %s", self.port, err)
+            return False
+        return True
+
+    def _drop_connection(self) -> Optional[asyncio.StreamWriter]:
+        writer = self._writer
+        self._reader = None
+        self._writer = None
+        self._serial = None
+        if writer is not None:
+            try:
+                writer.close()
+            except Exception as err:
+                _LOGGER.debug("RS485: Fehler beim Schließen von %s: %s", self.port, err)
+        return writer
+
+    async def close(self) -> None:
+        async with self._lock:
+            self._closed = True
+            # A reconnect started by a since-cancelled sender may still be opening the port
+            task = self._connect_task
+            if task is not None and not task.done():
+                try:
+                    await asyncio.shield(task)
+                except Exception:
+                    pass
+            writer = self._drop_connection()
+            if writer is None:
+                return
+            try:
+                await writer.wait_closed()
+            except Exception as err:
+                _LOGGER.debug("RS485: Fehler beim Schließen von %s: %s", self.port, err)
+            _LOGGER.info("HA UDK-0410 Dimmer: Verbindung zu %s geschlossen", self.port)
+
+    async def _flush_input(self, flush_window_s: float = 0.08) -> bytes:
+        """Best-effort flush of stale bytes.
+
+        Returns immediately when nothing is pending. Bytes already read by the
+        transport are consumed from the StreamReader (through read(), so a
+        transport paused on a full buffer is resumed), bytes still waiting
+        in the driver are discarded via reset_input_buffer().
+        """
+        if self._reader is None:
+            return b""
+
+        flushed = bytearray()
+        reader_buf = getattr(self._reader, "_buffer", None)
+        if reader_buf:
+            # Data is buffered, so this returns without waiting
+            flushed.extend(await self._reader.read(len(reader_buf)))
+
+        if self._serial is not None:
+            try:
+                waiting = self._serial.in_waiting
+                if waiting:
+                    self._serial.reset_input_buffer()
+                    _LOGGER.debug("RS485: %d bytes im Treiber-Puffer verworfen", waiting)
+            except Exception as err:
+                _LOGGER.debug("RS485: Input-Reset auf %s fehlgeschlagen: %s", self.port, err)
+        else:
+            # Transport without access to the serial object: fall back to a short timed drain
+            deadline = time.monotonic() + flush_window_s
+            while time.monotonic() < deadline:
+                try:
+                    async with asyncio.timeout(0.01):
+                        chunk = await self._reader.read(1024)
+                except TimeoutError:
+                    break
+                if not chunk:
+                    break
+                flushed.extend(chunk)
+
+        if flushed:
+            _LOGGER.debug(
+                "RS485: Flushed %d bytes stale input: %s",
+                len(flushed),
+                Hex(flushed),
+            )
+        return bytes(flushed)
+
+    def _write_backlogged(self) -> bool:
+        """Whether the transport buffer is above its low-water mark (drain needed)."""
+        transport = self._writer.transport
+        try:
+            return transport.get_write_buffer_size() > transport.get_write_buffer_limits()[0]
+        except NotImplementedError:
+            return True
+
+    async def send_and_wait_for(
+        self,
+        message: bytes,
+        pattern: re.Pattern[bytes],
+        *,
+        timeout_total: float = 0.8,
+        max_buffer: int = 4096,
+        flush_before_send: bool = True,
+    ) -> Tuple[bytes, Optional[bytes]]:
+        """Send a message and read until the pattern matches or timeout.
+
+        Several accepted responses can be combined into one pattern
+        (alternation); the matched bytes are returned.
+        """
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            # Keep the RS485 silent interval between frames, otherwise modules
+            # may miss the start of the next request
+            wait = self._next_tx - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                # A lost link (USB re-enumeration, unplugged adapter) is reopened
+                # and the frame sent once more
+                for _ in range(2):
+                    if self._writer is None and not await self._reconnect():
+                        break
+                    try:
+                        return await self._exchange(
+                            message, pattern, timeout_total, max_buffer, flush_before_send
+                        )
+                    except _ConnectionLost as err:
+                        _LOGGER.warning("RS485: Verbindung zu %s verloren: %s", self.port, err)
+                        self._drop_connection()
+                return b"", None
+            finally:
+                self._next_tx = loop.time() + self.SILENT_GAP_S
+
+    async def _exchange(
+        self,
+        message: bytes,
+        pattern: re.Pattern[bytes],
+        timeout_total: float,
+        max_buffer: int,
+        flush_before_send: bool,
+    ) -> Tuple[bytes, Optional[bytes]]:
+        """Write one frame and collect the response (caller holds the lock).
+
+        Raises _ConnectionLost if the serial link is gone.
+        """
+        if self._writer is None or self._reader is None:
+            raise _ConnectionLost("nicht verbunden")
+
+        if flush_before_send:
+            await self._flush_input()
+
+        _LOGGER.debug("RS485: Sende (hex): %s", Hex(message))
+        try:
+            self._writer.write(message)
+            if self._write_backlogged():
+                async with asyncio.timeout(self.DRAIN_TIMEOUT_S):
+                    await self._writer.drain()
+        except TimeoutError:
+            _LOGGER.warning("RS485: Timeout beim Schreiben auf %s", self.port)
+            return b"", None
+        except OSError as err:
+            raise _ConnectionLost(err) from err
+        except Exception as err:
+            _LOGGER.warning("RS485: Fehler beim Schreiben auf %s: %s", self.port, err)
+            return b"", None
+
+        buf = bytearray()
+        # Offset from which the next search has to start, so already
+        # scanned bytes are not searched again on every chunk.
+        search_start = 0
+        # One deadline for the whole response instead of a timer per read
+        try:
+            async with asyncio.timeout(timeout_total):
+                while True:
+                    chunk = await self._reader.read(1024)
+                    if not chunk:
+                        raise _ConnectionLost("EOF")
+
+                    buf.extend(chunk)
+
+                    if len(buf) > max_buffer:
+                        dropped = len(buf) - max_buffer
+                        del buf[:dropped]
+                        search_start = max(0, search_start - dropped)
+
+                    m = pattern.search(buf, search_start)
+                    if m is not None:
+                        matched = m.group(0)
+                        _LOGGER.debug(
+                            "RS485: Match gefunden (%s) im Buffer (%d bytes): %s",
+                            Hex(matched),
+                            len(buf),
+                            Hex(buf),
+                        )
+                        return bytes(buf), matched
+                    search_start = max(search_start, len(buf) - _MAX_PATTERN_LEN + 1)
+
+                    _LOGGER.debug(
+                        "RS485: Chunk %d bytes, Buffer %d bytes: %s",
+                        len(chunk),
+                        len(buf),
+                        Hex(chunk),
+                    )
+        except TimeoutError:
+            pass
+        except _ConnectionLost:
+            raise
+        except OSError as err:
+            raise _ConnectionLost(err) from err
+        except Exception as err:
+            _LOGGER.warning("RS485: Fehler beim Lesen auf %s: %s", self.port, err)
+
+        if buf:
+            _LOGGER.debug(
+                "RS485: Timeout ohne Match. Buffer (%d bytes): %s",
+                len(buf),
+                Hex(buf),
+            )
+        else:
+            _LOGGER.debug("RS485: Timeout ohne Match. Buffer leer.")
+        return bytes(buf), None
+
+    async def queue_set(
+        self,
+        address: int,
+        channel: int,
+        frame: bytes,
+        send: Callable[[bytes], Awaitable[bool]],
+    ) -> bool:
+        """Queue a SET frame for one channel and return whether it was acknowledged.
+
+        Frames for the same module address queued within BATCH_WINDOW_S are
+        merged and sent once via the send callback of the first request.
+        """
+        loop = asyncio.get_running_loop()
+        batch = self._pending.get(address)
+        if batch is None:
+            batch = self._pending[address] = _PendingSet(send=send)
+            loop.call_later(self.BATCH_WINDOW_S, self._start_flush, address)
+
+        batch.frames[channel] = frame
+        waiter: asyncio.Future[bool] = loop.create_future()
+        batch.waiters.append(waiter)
+        return await waiter
+
+    def _start_flush(self, address: int) -> None:
+        batch = self._pending.pop(address, None)
+        if batch is None:
+            return
+        task = asyncio.get_running_loop().create_task(self._flush(address, batch))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush(self, address: int, batch: _PendingSet) -> None:
+        if len(batch.frames) == 1:
+            frame = next(iter(batch.frames.values()))
+        else:
+            key = (address, frozenset(batch.frames.items()))
+            frame = self._merged_cache.get(key)
+            if frame is None:
+                frame = merge_set_frames(batch.frames)
+                if len(self._merged_cache) >= self.MERGED_CACHE_SIZE:
+                    del self._merged_cache[next(iter(self._merged_cache))]
+                self._merged_cache[key] = frame
+            _LOGGER.debug(
+                "RS485: %d Kanäle für addr=%d zusammengefasst -> %s",
+                len(batch.frames),
+                address,
+                Hex(frame),
+            )
+
+        try:
+            ok = await batch.send(frame)
+        except Exception as err:
+            _LOGGER.warning("RS485: Fehler beim Senden an addr=%d: %s", address, err)
+            ok = False
+
+        for waiter in batch.waiters:
+            if not waiter.done():
+                waiter.set_result(ok)
+
+
+async def async_get_shared_bus(hass: HomeAssistant, port: str, baudrate: int) -> Rs485Module:
+    """Return the process-wide bus for a serial port, opening it on first use.
+
+    Buses are keyed on the resolved device path, so aliases such as
+    /dev/serial/by-id/... and /dev/ttyUSB0 share one reader and one lock.
+    Every call must be paired with async_release_shared_bus.
+    """
+    path = port
+    if port.startswith("/"):
+        path = await hass.async_add_executor_job(os.path.realpath, port)
+    key = (path, int(baudrate))
+
+    buses: dict[tuple[str, int], Rs485Module] = hass.data.setdefault(SHARED_BUSES, {})
+    bus = buses.get(key)
+    if bus is None:
+        bus = Rs485Module(port=port, baudrate=int(baudrate))
+        buses[key] = bus
+    bus.users += 1
+
+    try:
+        await bus.connect()
+    except Exception:
+        await async_release_shared_bus(hass, bus)
+        raise
+    return bus
+
+
+async def async_release_shared_bus(hass: HomeAssistant, bus: Rs485Module) -> None:
+    """Drop one user of a shared bus; the last user closes the serial port."""
+    bus.users -= 1
+    if bus.users > 0:
+        return
+
+    buses: dict[tuple[str, int], Rs485Module] = hass.data.get(SHARED_BUSES, {})
+    for key, known in list(buses.items()):
+        if known is bus:
+            del buses[key]
+    await bus.close()
@@ -20,6 +20,9 @@ from .const import (
 DEFAULT_PORT = "/dev/ttyUSB0"
 DEFAULT_BAUDRATE = 38400
 
+# Form fields for the 4 channel names, channel i+1 <-> _CH_KEYS[i]
+_CH_KEYS = ("d1", "d2", "d3", "d4")
+
 
 def _default_modules():
     return []
@@ -66,7 +69,25 @@ class Rs485DimmerOptionsFlowHandler(config_entries.OptionsFlow):
     def __init__(self, config_entry: config_entries.ConfigEntry) -> None:
         super().__init__()
         self._config_entry = config_entry
-        self._modules = list(config_entry.options.get(CONF_MODULES, []))
+        # Modules keyed by address, in configured order. The module dicts are
+        # the live entry options; they are copied before the first edit.
+        self._by_addr: dict[int, dict] = {
+            int(m[MOD_ADDRESS]): m for m in config_entry.options.get(CONF_MODULES, [])
+        }
+        self._copied: set[int] = set()
+
+    def _writable_module(self, addr: int) -> dict:
+        """Return a private copy of a module that may be modified."""
+        module = self._by_addr[addr]
+        if addr not in self._copied:
+            module = {
+                **module,
+                MOD_ADDRESS: addr,
+                MOD_DIMMERS: [dict(d) for d in module.get(MOD_DIMMERS, [])],
+            }
+            self._by_addr[addr] = module
+            self._copied.add(addr)
+        return module
 
     async def async_step_init(self, user_input=None) -> FlowResult:
         return self.async_show_menu(
@@ -82,17 +103,16 @@ class Rs485DimmerOptionsFlowHandler(config_entries.OptionsFlow):
             address = int(user_input[MOD_ADDRESS])
             name = user_input[MOD_NAME].strip() or f"M{address:02d}"
 
-            if any(int(m.get(MOD_ADDRESS)) == address for m in self._modules):
+            if address in self._by_addr:
                 errors[MOD_ADDRESS] = "address_exists"
             else:
                 # Default: 4 channels with index 1..4
                 dimmers = [
-                    {"index": 1, "name": user_input["d1"].strip() or f"Dimmer {address}-1"},
-                    {"index": 2, "name": user_input["d2"].strip() or f"Dimmer {address}-2"},
-                    {"index": 3, "name": user_input["d3"].strip() or f"Dimmer {address}-3"},
-                    {"index": 4, "name": user_input["d4"].strip() or f"Dimmer {address}-4"},
+                    {"index": i, "name": user_input[key].strip() or f"Dimmer {address}-{i}"}
+                    for i, key in enumerate(_CH_KEYS, start=1)
                 ]
-                self._modules.append({MOD_NAME: name, MOD_ADDRESS: address, MOD_DIMMERS: dimmers})
+                self._by_addr[address] = {MOD_NAME: name, MOD_ADDRESS: address, MOD_DIMMERS: dimmers}
+                self._copied.add(address)
                 return await self._save_and_exit()
 
         schema = vol.Schema(
@@ -101,10 +121,10 @@ class Rs485DimmerOptionsFlowHandler(config_entries.OptionsFlow):
                     selector.NumberSelectorConfig(min=1, max=247, step=1, mode=selector.NumberSelectorMode.BOX)
                 ),
                 vol.Required(MOD_NAME, default="M01"): selector.TextSelector(),
-                vol.Required("d1", default="Kanal 1"): selector.TextSelector(),
-                vol.Required("d2", default="Kanal 2"): selector.TextSelector(),
-                vol.Required("d3", default="Kanal 3"): selector.TextSelector(),
-                vol.Required("d4", default="Kanal 4"): selector.TextSelector(),
+                **{
+                    vol.Required(key, default=f"Kanal {i}"): selector.TextSelector()
+                    for i, key in enumerate(_CH_KEYS, start=1)
+                },
             }
         )
 
@@ -112,55 +132,55 @@ class Rs485DimmerOptionsFlowHandler(config_entries.OptionsFlow):
 
     # -------- Edit Module --------
     async def async_step_edit_module(self, user_input=None) -> FlowResult:
-        if not self._modules:
+        if not self._by_addr:
             return await self._save_and_exit()
 
         # First step: select module
         if user_input is None:
             options = {
-                str(m[MOD_ADDRESS]): f"{m.get(MOD_NAME, '')} (addr {m[MOD_ADDRESS]})"
-                for m in self._modules
+                str(addr): f"{m.get(MOD_NAME, '')} (addr {addr})"
+                for addr, m in self._by_addr.items()
             }
             schema = vol.Schema({vol.Required("module"): vol.In(options)})
             return self.async_show_form(step_id="edit_module", data_schema=schema)
 
         addr = int(user_input["module"])
-        module = next((m for m in self._modules if int(m.get(MOD_ADDRESS)) == addr), None)
-        if module is None:
+        if addr not in self._by_addr:
             return await self._save_and_exit()
 
         self._editing_addr = addr
         return await self.async_step_edit_module_details()
 
     async def async_step_edit_module_details(self, user_input=None) -> FlowResult:
-        module = next((m for m in self._modules if int(m.get(MOD_ADDRESS)) == int(self._editing_addr)), None)
+        addr = self._editing_addr
+        module = self._by_addr.get(addr)
         if module is None:
             return await self._save_and_exit()
 
         if user_input is not None:
-            module[MOD_NAME] = user_input[MOD_NAME].strip() or module.get(MOD_NAME, f"M{module[MOD_ADDRESS]:02d}")
+            module = self._writable_module(addr)
+            module[MOD_NAME] = user_input[MOD_NAME].strip() or module.get(MOD_NAME, f"M{addr:02d}")
             dimmers = module.get(MOD_DIMMERS, [])
             # Ensure list length 4
             while len(dimmers) < 4:
                 dimmers.append({"index": len(dimmers) + 1, "name": f"Kanal {len(dimmers) + 1}"})
-            for i in range(4):
-                key = f"d{i+1}"
+            for i, key in enumerate(_CH_KEYS):
                 dimmers[i]["index"] = i + 1
                 dimmers[i]["name"] = user_input.get(key, dimmers[i].get("name", f"Kanal {i+1}")).strip() or f"Kanal {i+1}"
             module[MOD_DIMMERS] = dimmers[:4]
             return await self._save_and_exit()
 
-        dimmers = module.get(MOD_DIMMERS, [])
+        dimmers = list(module.get(MOD_DIMMERS, []))
         while len(dimmers) < 4:
             dimmers.append({"index": len(dimmers) + 1, "name": f"Kanal {len(dimmers) + 1}"})
 
         schema = vol.Schema(
             {
-                vol.Required(MOD_NAME, default=module.get(MOD_NAME, f"M{module[MOD_ADDRESS]:02d}")): selector.TextSelector(),
-                vol.Required("d1", default=dimmers[0].get("name", "Kanal 1")): selector.TextSelector(),
-                vol.Required("d2", default=dimmers[1].get("name", "Kanal 2")): selector.TextSelector(),
-                vol.Required("d3", default=dimmers[2].get("name", "Kanal 3")): selector.TextSelector(),
-                vol.Required("d4", default=dimmers[3].get("name", "Kanal 4")): selector.TextSelector(),
+                vol.Required(MOD_NAME, default=module.get(MOD_NAME, f"M{addr:02d}")): selector.TextSelector(),
+                **{
+                    vol.Required(key, default=dimmers[i].get("name", f"Kanal {i+1}")): selector.TextSelector()
+                    for i, key in enumerate(_CH_KEYS)
+                },
             }
         )
 
@@ -168,20 +188,19 @@ class Rs485DimmerOptionsFlowHandler(config_entries.OptionsFlow):
 
     # -------- Remove Module --------
     async def async_step_remove_module(self, user_input=None) -> FlowResult:
-        if not self._modules:
+        if not self._by_addr:
             return await self._save_and_exit()
 
         if user_input is not None:
-            addr = int(user_input["module"])
-            self._modules = [m for m in self._modules if int(m.get(MOD_ADDRESS)) != addr]
+            self._by_addr.pop(int(user_input["module"]), None)
             return await self._save_and_exit()
 
         options = {
-            str(m[MOD_ADDRESS]): f"{m.get(MOD_NAME, '')} (addr {m[MOD_ADDRESS]})"
-            for m in self._modules
+            str(addr): f"{m.get(MOD_NAME, '')} (addr {addr})"
+            for addr, m in self._by_addr.items()
         }
         schema = vol.Schema({vol.Required("module"): vol.In(options)})
         return self.async_show_form(step_id="remove_module", data_schema=schema)
 
     async def _save_and_exit(self) -> FlowResult:
-        return self.async_create_entry(title="", data={CONF_MODULES: self._modules})
+        return self.async_create_entry(title="", data={CONF_MODULES: list(self._by_addr.values())})
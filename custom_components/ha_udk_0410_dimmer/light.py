@@ -1,186 +1,80 @@
 """Platform support for RS485 dimmer.
 
-Robust ACK handling:
-- flushes stale bytes before sending (best-effort)
-- reads in small chunks until an ACK pattern is found or a deadline is hit
+Robust ACK handling (transport and batching live in bus.py):
+- retries share one time budget; a (presumed) NAK from the module aborts immediately
 - structured debug logs (sent hex, received hex, buffer lengths, timeouts, retries)
 
 ACK frame expected (4 bytes): FE <module_address> 06 FF
+Assumed NAK frame (4 bytes):  FE <module_address> 15 FF
+(0x15 is the ASCII NAK code; not confirmed by UDK-0410 documentation)
 """
 
 from __future__ import annotations
 
-import asyncio
-import binascii
 import logging
-import time
-from typing import Optional, Tuple
+import re
+from typing import Tuple
 
-import serial_asyncio
 from homeassistant.components.light import ATTR_BRIGHTNESS, ColorMode, LightEntity
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers import entity_registry as er
 
+from .bus import Hex, Rs485Module
 from .const import CONF_MODULES, DOMAIN, MOD_ADDRESS, MOD_DIMMERS, MOD_NAME
 
 _LOGGER = logging.getLogger("custom_components.ha_udk_0410_dimmer")
 
+# Response frames: FE <module_address> <ACK|NAK> FF
+# The NAK code is an unverified assumption (ASCII NAK), not taken from the protocol docs.
+_RESP_START = b"\xfe"
+_RESP_END = b"\xff"
+_ACK = 0x06
+_NAK = 0x15
 
-class Rs485Module:
-    """Shared RS485 connection per serial port (with a lock)."""
 
-    def __init__(
-        self,
-        port: str = "/dev/serial/by-id/usb-FTDI_FT232R_USB_UART_BG00Y9JZ-if00-port0",
-        baudrate: int = 38400,
-    ):
-        self.port = port
-        self.baudrate = baudrate
-        self._reader: Optional[asyncio.StreamReader] = None
-        self._writer: Optional[asyncio.StreamWriter] = None
-        self._lock = asyncio.Lock()
-
-    async def connect(self) -> None:
-        if self._writer is not None and self._reader is not None:
-            return
-
-        _LOGGER.debug("RS485: Öffne serielle Verbindung %s @ %d", self.port, self.baudrate)
-        self._reader, self._writer = await serial_asyncio.open_serial_connection(
-            url=self.port, baudrate=self.baudrate, bytesize=8, parity="N", stopbits=1
-        )
-        _LOGGER.debug("RS485: Serielle Verbindung zu %s aufgebaut", self.port)
-        _LOGGER.info("HA UDK-0410 Dimmer: Verbunden mit %s @ %d baud", self.port, self.baudrate)
-
-    async def _flush_input(self, flush_window_s: float = 0.08) -> bytes:
-        """Best-effort flush of stale bytes."""
-        if self._reader is None:
-            return b""
-
-        flushed = bytearray()
-        deadline = time.monotonic() + flush_window_s
-
-        while time.monotonic() < deadline:
-            try:
-                chunk = await asyncio.wait_for(self._reader.read(1024), timeout=0.01)
-            except asyncio.TimeoutError:
-                break
-            if not chunk:
-                break
-            flushed.extend(chunk)
-
-        if flushed:
-            _LOGGER.debug(
-                "RS485: Flushed %d bytes stale input: %s",
-                len(flushed),
-                binascii.hexlify(flushed).decode(),
-            )
-        return bytes(flushed)
-
-    async def send_and_wait_for(
-        self,
-        message: bytes,
-        patterns: list[bytes],
-        *,
-        timeout_total: float = 0.8,
-        read_chunk_timeout: float = 0.12,
-        max_buffer: int = 4096,
-        flush_before_send: bool = True,
-    ) -> Tuple[bytes, Optional[bytes]]:
-        """Send a message and read until one of the patterns appears or timeout."""
-        if self._writer is None or self._reader is None:
-            _LOGGER.warning("RS485: Verbindung nicht hergestellt (port %s)", self.port)
-            return b"", None
-
-        async with self._lock:
-            if flush_before_send:
-                await self._flush_input()
-
-            _LOGGER.debug("RS485: Sende (hex): %s", binascii.hexlify(message).decode())
-            try:
-                self._writer.write(message)
-                await self._writer.drain()
-            except Exception as err:
-                _LOGGER.warning("RS485: Fehler beim Schreiben auf %s: %s", self.port, err)
-                return b"", None
-
-            buf = bytearray()
-            deadline = time.monotonic() + timeout_total
-
-            while time.monotonic() < deadline:
-                remaining = deadline - time.monotonic()
-                chunk_timeout = min(read_chunk_timeout, max(0.01, remaining))
-
-                try:
-                    chunk = await asyncio.wait_for(self._reader.read(1024), timeout=chunk_timeout)
-                except asyncio.TimeoutError:
-                    continue
-                except Exception as err:
-                    _LOGGER.warning("RS485: Fehler beim Lesen auf %s: %s", self.port, err)
-                    break
-
-                if chunk:
-                    buf.extend(chunk)
-
-                    if len(buf) > max_buffer:
-                        buf[:] = buf[-max_buffer:]
-
-                    for p in patterns:
-                        if p in buf:
-                            _LOGGER.debug(
-                                "RS485: Match gefunden (%s) im Buffer (%d bytes): %s",
-                                binascii.hexlify(p).decode(),
-                                len(buf),
-                                binascii.hexlify(buf).decode(),
-                            )
-                            return bytes(buf), p
-
-                    _LOGGER.debug(
-                        "RS485: Chunk %d bytes, Buffer %d bytes: %s",
-                        len(chunk),
-                        len(buf),
-                        binascii.hexlify(chunk).decode(),
-                    )
-
-            if buf:
-                _LOGGER.debug(
-                    "RS485: Timeout ohne Match. Buffer (%d bytes): %s",
-                    len(buf),
-                    binascii.hexlify(buf).decode(),
-                )
-            else:
-                _LOGGER.debug("RS485: Timeout ohne Match. Buffer leer.")
-            return bytes(buf), None
+def _response_re(module_address: int) -> re.Pattern[bytes]:
+    """Return the compiled ACK/assumed-NAK pattern (FE <addr> 06|15 FF) for a module address."""
+    return re.compile(
+        re.escape(_RESP_START + bytes((module_address,)))
+        + b"[" + re.escape(bytes((_ACK, _NAK))) + b"]"
+        + re.escape(_RESP_END)
+    )
 
 
 class Rs485Dimmer(LightEntity):
-    SYNC_BYTE = 0xFF
-    START_BYTE = 0xFE
-    STOP_BYTE = 0xFF
-    CMD_SET = 0x57
+    FRAME_CACHE_SIZE = 16
 
-    def __init__(self, hass, name: str, module: Rs485Module, module_address: int, dimmer_index: int):
+    def __init__(
+        self,
+        hass,
+        name: str,
+        module: Rs485Module,
+        module_address: int,
+        dimmer_index: int,
+        unique_id: str | None = None,
+    ):
         self.hass = hass
-        self._name = name
+        # Static per entity; plain _attr_* values avoid property calls on every state write
+        self._attr_name = name
+        self._attr_unique_id = unique_id
         self.module = module
         self.module_address = int(module_address)
         self.dimmer_index = int(dimmer_index)
-        self._is_on = False
-        self._brightness = 0
-        self._attr_supported_color_modes = {ColorMode.BRIGHTNESS}
-        self._unique_id: str | None = None
 
-    @property
-    def name(self):
-        return self._name
+        self._channel = max(0, min(3, self.dimmer_index - 1))
+        self._frame = module.module_frame(self.module_address)
+        # Recently built frames keyed by (level, dimm_time_s), oldest first
+        self._frame_cache: dict[tuple[int, int], bytes] = {}
+        # (level, dimm_time_s, is_on) of the last command the module acknowledged
+        self._last_sent: tuple[int, int, bool] | None = None
 
-    @property
-    def unique_id(self):
-        return self._unique_id
+        self._response_re = _response_re(self.module_address)
+        self._ack_frame = _RESP_START + bytes((self.module_address, _ACK)) + _RESP_END
 
-    @unique_id.setter
-    def unique_id(self, value):
-        self._unique_id = value
+        self._is_on = False
+        self._brightness = 0
+        self._attr_supported_color_modes = {ColorMode.BRIGHTNESS}
 
     @property
     def is_on(self):
@@ -194,145 +88,185 @@ class Rs485Dimmer(LightEntity):
     def color_mode(self):
         return ColorMode.BRIGHTNESS
 
-    def _build_data_array(self, level: int, dimm_time_s: int) -> list[int]:
-        levels = [1, 1, 1, 1]
-        times = [5, 5, 5, 5]
-        idx = max(0, min(3, self.dimmer_index - 1))
-        levels[idx] = max(0, min(255, int(level)))
-        times[idx] = max(0, min(255, int(dimm_time_s)))
-        data: list[int] = []
-        for i in range(4):
-            data.append(levels[i])
-            data.append(times[i])
-        return data
-
-    def _ack_pattern(self) -> bytes:
-        return bytes([0xFE, self.module_address, 0x06, 0xFF])
+    @staticmethod
+    def _dimm_time(kwargs) -> int:
+        """Transition in whole seconds, clamped to 0..255 (default 5)."""
+        transition = kwargs.get("transition")
+        if transition is None:
+            return 5
+        try:
+            dimm_time_s = int(float(transition))
+        except Exception:
+            return 5
+        if not 0 <= dimm_time_s <= 255:
+            dimm_time_s = 0 if dimm_time_s < 0 else 255
+        return dimm_time_s
+
+    def _build_message(self, level: int, dimm_time_s: int) -> bytes:
+        """Expects level and dimm_time_s already validated to 0..255."""
+        key = (level, dimm_time_s)
+        cached = self._frame_cache.get(key)
+        if cached is not None:
+            return cached
+
+        message = self._frame.build(self._channel, level, dimm_time_s)
+
+        if len(self._frame_cache) >= self.FRAME_CACHE_SIZE:
+            del self._frame_cache[next(iter(self._frame_cache))]
+        self._frame_cache[key] = message
+        return message
 
     async def sende_befehl_mit_ack(
         self,
         message: bytes,
         *,
         max_wiederholungen: int = 3,
-        timeout_total: float = 0.8,
-        read_chunk_timeout: float = 0.12,
+        total_budget: float = 0.9,
+        timeouts: Tuple[float, ...] = (0.3, 0.5),
     ) -> bool:
-        ack_pat = self._ack_pattern()
+        """Send a frame until it is acknowledged.
+
+        Attempt n waits timeouts[n] for the response; the attempt after the
+        listed ones gets what is left of total_budget. The budget only counts
+        response waits, not time spent waiting for the shared bus lock.
+        A response with the assumed NAK code ends the retries immediately.
+        """
+        remaining = total_budget
 
         for attempt in range(1, max_wiederholungen + 1):
+            if remaining <= 0:
+                break
+            if attempt <= len(timeouts):
+                timeout = min(timeouts[attempt - 1], remaining)
+            else:
+                timeout = remaining
+            remaining -= timeout
+
             _LOGGER.debug(
-                "RS485Dimmer[%s]: Sende Versuch %d/%d (addr=%d idx=%d)",
-                self._name,
+                "RS485Dimmer[%s]: Sende Versuch %d/%d (addr=%d idx=%d timeout=%.2fs)",
+                self._attr_name,
                 attempt,
                 max_wiederholungen,
                 self.module_address,
                 self.dimmer_index,
+                timeout,
             )
 
             buf, matched = await self.module.send_and_wait_for(
                 message,
-                patterns=[ack_pat],
-                timeout_total=timeout_total,
-                read_chunk_timeout=read_chunk_timeout,
+                self._response_re,
+                timeout_total=timeout,
                 flush_before_send=True,
             )
 
-            if matched == ack_pat:
+            if matched == self._ack_frame:
                 _LOGGER.debug(
                     "RS485Dimmer[%s]: ACK OK (addr=%d). BufferLen=%d",
-                    self._name,
+                    self._attr_name,
                     self.module_address,
                     len(buf),
                 )
                 return True
 
+            if matched is not None:
+                _LOGGER.warning(
+                    "RS485Dimmer[%s]: NAK (0x15, angenommen) von addr=%d (attempt %d/%d), breche ab. Buffer=%s",
+                    self._attr_name,
+                    self.module_address,
+                    attempt,
+                    max_wiederholungen,
+                    Hex(buf),
+                )
+                return False
+
             _LOGGER.warning(
                 "RS485Dimmer[%s]: Kein ACK (attempt %d/%d). BufferLen=%d Buffer=%s",
-                self._name,
+                self._attr_name,
                 attempt,
                 max_wiederholungen,
                 len(buf),
-                binascii.hexlify(buf).decode() if buf else "",
+                Hex(buf),
             )
 
         return False
 
+    def _set_state(self, is_on: bool, brightness: int) -> None:
+        """Store the confirmed state; only notify HA if it actually changed."""
+        if (self._is_on, self._brightness) == (is_on, brightness):
+            return
+        self._is_on = is_on
+        self._brightness = brightness
+        self.async_schedule_update_ha_state()
+
     async def async_turn_on(self, **kwargs):
-        level = kwargs.get(ATTR_BRIGHTNESS, 255)
-        transition = kwargs.get("transition")
+        level = int(kwargs.get(ATTR_BRIGHTNESS, 255))
+        if not 0 <= level <= 255:
+            level = 0 if level < 0 else 255
+        dimm_time_s = self._dimm_time(kwargs)
+
+        desired = (level, dimm_time_s, True)
+        if desired == self._last_sent and self._is_on:
+            _LOGGER.debug("RS485Dimmer[%s]: Set unverändert, nicht erneut gesendet", self._attr_name)
+            return
 
-        if transition is not None:
-            try:
-                dimm_time_s = int(float(transition))
-            except Exception:
-                dimm_time_s = 5
-        else:
-            dimm_time_s = 5
-
-        data = self._build_data_array(level, dimm_time_s)
-        payload = [self.module_address, self.CMD_SET] + data
-        checksum = (sum(payload) & 0xFF) & 0x7F
-
-        message = bytes(
-            [self.SYNC_BYTE, self.START_BYTE, self.module_address, self.CMD_SET]
-            + data
-            + [checksum, self.STOP_BYTE]
-        )
+        message = self._build_message(level, dimm_time_s)
 
-        _LOGGER.debug("RS485Dimmer[%s]: Sende Set -> %s", self._name, binascii.hexlify(message).decode())
+        _LOGGER.debug("RS485Dimmer[%s]: Sende Set -> %s", self._attr_name, Hex(message))
 
-        success = await self.sende_befehl_mit_ack(
-            message,
-            max_wiederholungen=3,
-            timeout_total=0.8,
-            read_chunk_timeout=0.12,
+        success = await self.module.queue_set(
+            self.module_address, self._channel, message, self.sende_befehl_mit_ack
         )
 
-        if success:
-            self._is_on = True
-            self._brightness = level
-        else:
-            _LOGGER.warning("RS485Dimmer[%s]: Einschalten nicht bestätigt (kein ACK).", self._name)
+        if not success:
+            _LOGGER.warning("RS485Dimmer[%s]: Einschalten nicht bestätigt (kein ACK).", self._attr_name)
+            return
 
-        self.async_schedule_update_ha_state()
+        self._last_sent = desired
+        self._set_state(True, level)
 
     async def async_turn_off(self, **kwargs):
-        transition = kwargs.get("transition")
+        dimm_time_s = self._dimm_time(kwargs)
 
-        if transition is not None:
-            try:
-                dimm_time_s = int(float(transition))
-            except Exception:
-                dimm_time_s = 5
-        else:
-            dimm_time_s = 5
-
-        data = self._build_data_array(0, dimm_time_s)
-        payload = [self.module_address, self.CMD_SET] + data
-        checksum = (sum(payload) & 0xFF) & 0x7F
-
-        message = bytes(
-            [self.SYNC_BYTE, self.START_BYTE, self.module_address, self.CMD_SET]
-            + data
-            + [checksum, self.STOP_BYTE]
-        )
+        desired = (0, dimm_time_s, False)
+        if desired == self._last_sent and not self._is_on:
+            _LOGGER.debug("RS485Dimmer[%s]: Off unverändert, nicht erneut gesendet", self._attr_name)
+            return
 
-        _LOGGER.debug("RS485Dimmer[%s]: Sende Off -> %s", self._name, binascii.hexlify(message).decode())
+        message = self._build_message(0, dimm_time_s)
 
-        success = await self.sende_befehl_mit_ack(
-            message,
-            max_wiederholungen=3,
-            timeout_total=0.8,
-            read_chunk_timeout=0.12,
+        _LOGGER.debug("RS485Dimmer[%s]: Sende Off -> %s", self._attr_name, Hex(message))
+
+        success = await self.module.queue_set(
+            self.module_address, self._channel, message, self.sende_befehl_mit_ack
         )
 
         if not success:
-            _LOGGER.warning("RS485Dimmer[%s]: Ausschalten nicht bestätigt (kein ACK).", self._name)
+            _LOGGER.warning("RS485Dimmer[%s]: Ausschalten nicht bestätigt (kein ACK).", self._attr_name)
             return
 
-        self._is_on = False
-        self._brightness = 0
-        self.async_schedule_update_ha_state()
+        self._last_sent = desired
+        self._set_state(False, 0)
+
+
+def _iter_channels(modules_cfg: list[dict]):
+    """Yield (module_address, dimmer_index, unique_id, full_name) for every configured channel."""
+    for module_cfg in modules_cfg:
+        module_name = module_cfg.get(MOD_NAME, "Module")
+        module_addr = int(module_cfg.get(MOD_ADDRESS, 1))
+
+        dimmers = list(module_cfg.get(MOD_DIMMERS, []) or [])
+        while len(dimmers) < 4:
+            dimmers.append({"index": len(dimmers) + 1, "name": f"Kanal {len(dimmers) + 1}"})
+
+        for idx, d in enumerate(dimmers[:4]):
+            dimmer_name = d.get("name", f"Dimmer {idx+1}")
+            dimmer_index = int(d.get("index", idx + 1))
+            yield (
+                module_addr,
+                dimmer_index,
+                f"ha_udk_0410_dimmer_{module_addr}_{dimmer_index}",
+                f"{module_name}D{dimmer_index} - {dimmer_name}",
+            )
 
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_entities) -> None:
@@ -351,52 +285,37 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_e
 
     entities: list[Rs485Dimmer] = []
 
-    port_map = hass.data.setdefault(DOMAIN + "_ports", {})
-    port_key = f"{runtime.port}@{runtime.baudrate}"
-    module_obj = port_map.get(port_key)
-    if module_obj is None:
-        module_obj = Rs485Module(port=runtime.port, baudrate=int(runtime.baudrate))
-        await module_obj.connect()
-        port_map[port_key] = module_obj
+    # Bus is opened by __init__.async_setup_entry before forwarding
+    module_obj = runtime.bus
 
     ent_reg = er.async_get(hass)
+    # One indexed registry lookup instead of two per channel
+    existing_by_uid = {
+        e.unique_id: e
+        for e in er.async_entries_for_config_entry(ent_reg, entry.entry_id)
+        if e.domain == "light"
+    }
+
+    for module_addr, dimmer_index, unique_id, full_name in _iter_channels(modules_cfg):
+        entity = Rs485Dimmer(
+            hass,
+            full_name,
+            module_obj,
+            module_address=module_addr,
+            dimmer_index=dimmer_index,
+            unique_id=unique_id,
+        )
 
-    for module_cfg in modules_cfg:
-        module_name = module_cfg.get(MOD_NAME, "Module")
-        module_addr = int(module_cfg.get(MOD_ADDRESS, 1))
-
-        dimmers = list(module_cfg.get(MOD_DIMMERS, []) or [])
-        while len(dimmers) < 4:
-            dimmers.append({"index": len(dimmers) + 1, "name": f"Kanal {len(dimmers) + 1}"})
-
-        for idx, d in enumerate(dimmers[:4]):
-            dimmer_name = d.get("name", f"Dimmer {idx+1}")
-            dimmer_index = int(d.get("index", idx + 1))
-            full_name = f"{module_name}D{dimmer_index} - {dimmer_name}"
-
-            entity = Rs485Dimmer(
-                hass,
+        entry_obj = existing_by_uid.get(unique_id)
+        if entry_obj is not None and (entry_obj.name or "") != full_name:
+            _LOGGER.info(
+                "HA UDK-0410 Dimmer: Aktualisiere Namen %s -> %s",
+                entry_obj.entity_id,
                 full_name,
-                module_obj,
-                module_address=module_addr,
-                dimmer_index=dimmer_index,
             )
-            unique_id = f"ha_udk_0410_dimmer_{module_addr}_{dimmer_index}"
-            entity.unique_id = unique_id
-
-            existing_entity_id = ent_reg.async_get_entity_id("light", DOMAIN, unique_id)
-            if existing_entity_id:
-                entry_obj = ent_reg.async_get(existing_entity_id)
-                current_name = (entry_obj.name or "") if entry_obj else ""
-                if current_name != full_name:
-                    _LOGGER.info(
-                        "HA UDK-0410 Dimmer: Aktualisiere Namen %s -> %s",
-                        existing_entity_id,
-                        full_name,
-                    )
-                    ent_reg.async_update_entity(existing_entity_id, name=full_name)
-
-            entities.append(entity)
+            ent_reg.async_update_entity(entry_obj.entity_id, name=full_name)
+
+        entities.append(entity)
 
     if entities:
         async_add_entities(entities, True)
@@ -0,0 +1,77 @@
+"""UDK-0410 SET frame layout and builders.
+
+SET frame: FF FE <addr> 57 | (level, time) x 4 | checksum | FF
+The checksum is sum(addr, CMD, data) & 0x7F.
+"""
+
+from __future__ import annotations
+
+import struct
+
+SYNC_BYTE = 0xFF
+START_BYTE = 0xFE
+STOP_BYTE = 0xFF
+CMD_SET = 0x57
+
+# SET data bytes (level, time) x 4 channels; untouched channels keep these defaults
+FRAME_DEFAULT = (1, 5, 1, 5, 1, 5, 1, 5)
+# SET frame layout: FF FE <addr> 57 | 8 data bytes | checksum | FF
+SET_FRAME = struct.Struct(">BBBB8sBB")
+DATA_OFF = 4
+CHECKSUM_OFF = 12
+
+
+def merge_set_frames(frames: dict[int, bytes]) -> bytes:
+    """Merge single-channel SET frames of one module into one frame.
+
+    frames maps the channel slot (0..3) to a frame built for that channel;
+    the level/time bytes of each slot are taken from its own frame.
+    """
+    merged = bytearray(next(iter(frames.values())))
+    for channel, frame in frames.items():
+        off = DATA_OFF + channel * 2
+        merged[off : off + 2] = frame[off : off + 2]
+    merged[CHECKSUM_OFF] = sum(merged[2:CHECKSUM_OFF]) & 0x7F
+    return bytes(merged)
+
+
+class ModuleFrame:
+    """SET frame builder shared by the four channels of one module address.
+
+    Holds one full-size frame (header, default data, checksum slot, stop
+    byte); a build patches one channel slot and the checksum, copies the
+    frame and restores the slot defaults.
+    """
+
+    __slots__ = ("_buf", "_const_sums")
+
+    def __init__(self, address: int) -> None:
+        self._buf = bytearray(
+            SET_FRAME.pack(
+                SYNC_BYTE,
+                START_BYTE,
+                address,
+                CMD_SET,
+                bytes(FRAME_DEFAULT),
+                0,
+                STOP_BYTE,
+            )
+        )
+        # Checksum covers addr, CMD and data; per channel precompute everything
+        # except that channel's level/time so a build only adds those two bytes.
+        base = sum(self._buf[2:CHECKSUM_OFF])
+        self._const_sums = tuple(
+            (base - FRAME_DEFAULT[ch * 2] - FRAME_DEFAULT[ch * 2 + 1]) & 0xFF for ch in range(4)
+        )
+
+    def build(self, channel: int, level: int, dimm_time_s: int) -> bytes:
+        buf = self._buf
+        off = DATA_OFF + channel * 2
+        buf[off] = level
+        buf[off + 1] = dimm_time_s
+        buf[CHECKSUM_OFF] = (self._const_sums[channel] + level + dimm_time_s) & 0x7F
+        frame = bytes(buf)
+        buf[off] = FRAME_DEFAULT[channel * 2]
+        buf[off + 1] = FRAME_DEFAULT[channel * 2 + 1]
+        return frame
+